@@ -9,7 +9,9 @@ import os
 import sys
 import subprocess
 import shutil
+import importlib.util
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # 项目根目录
 BASE_DIR = Path(__file__).parent.absolute()
@@ -20,9 +22,14 @@ MAIN_SCRIPT = BASE_DIR / "main_gui.py"
 # 图标文件
 ICON_FILE = BASE_DIR / "favicon.ico"
 
+# 程序名称
+APP_NAME = "SSH批量运维工具"
+
 # 输出目录
 DIST_DIR = BASE_DIR / "dist"
 BUILD_DIR = BASE_DIR / "build"
+# onedir 模式下的程序目录（exe 与依赖、配置文件同目录）
+APP_DIR = DIST_DIR / APP_NAME
 
 # 配置文件列表（需要复制到dist目录的文件）
 CONFIG_FILES = [
@@ -33,12 +40,15 @@ CONFIG_FILES = [
 def run_command(cmd, cwd=None):
     """执行命令并返回结果"""
     print(f"执行命令: {' '.join(cmd)}")
+    # Windows 下不为子进程分配控制台窗口 (conhost.exe)
+    flags = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
     result = subprocess.run(
         cmd,
         cwd=cwd,
         capture_output=True,
         text=True,
-        shell=True
+        shell=False,
+        creationflags=flags
     )
     print(f"返回码: {result.returncode}")
     if result.stdout:
@@ -50,8 +60,8 @@ def run_command(cmd, cwd=None):
 def check_pyinstaller():
     """检查PyInstaller是否已安装"""
     print("检查PyInstaller是否已安装...")
-    result = run_command([sys.executable, "-m", "pip", "list"])
-    if "pyinstaller" in result.stdout.lower():
+    # 直接查找模块，无需执行耗时的 pip list
+    if importlib.util.find_spec("PyInstaller") is not None:
         print("✓ PyInstaller已安装")
         return True
     else:
@@ -75,7 +85,8 @@ def clean_old_builds():
         print(f"✓ 删除目录: {BUILD_DIR}")
 
 def create_spec_file():
-    """创建PyInstaller spec文件"""
+    """创建PyInstaller spec文件（供手动 pyinstaller *.spec 使用，main() 不调用）
+    实际打包参数以 build_exe() 的命令行为准，修改打包选项时两处需保持一致"""
     spec_content = """
 # -*- mode: python ; coding: utf-8 -*-
 
@@ -90,7 +101,7 @@ a = Analysis(
         ('{}/hosts_data.json', '.'),
         ('{}/favicon.ico', '.'),
     ],
-    hiddenimports=['paramiko', 'yaml', 'tkinter', 'logging', 'threading', 'queue', 'json', 'time', 're', 'datetime', 'sys', 'os', 'concurrent.futures'],
+    hiddenimports=['paramiko', 'yaml', 'tkinter', 'logging', 'threading', 'queue', 'json', 'time', 're', 'datetime', 'sys', 'os', 'concurrent.futures', 'orjson'],
     hookspath=[],
     hooksconfig={{}},
     runtime_hooks=[],
@@ -105,17 +116,13 @@ pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
     [],
-    name='SSH批量运维工具',
+    exclude_binaries=True,
+    name='{}',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -124,6 +131,17 @@ exe = EXE(
     entitlements_file=None,
     icon='{}',
 )
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='{}',
+)
 """
     
     spec_file = BASE_DIR / "ssh_batch_tool.spec"
@@ -134,22 +152,27 @@ exe = EXE(
             BASE_DIR,
             BASE_DIR,
             BASE_DIR,
-            ICON_FILE
+            APP_NAME,
+            ICON_FILE,
+            APP_NAME
         ))
     print(f"✓ 创建spec文件: {spec_file}")
     return spec_file
 
 def build_exe():
-    """使用PyInstaller打包程序"""
+    """使用PyInstaller打包程序（onedir 模式，避免 onefile 每次启动解压到临时目录）"""
     print("使用PyInstaller打包程序...")
     
-    # 构建命令，显式指定输出目录
+    # 构建命令，显式指定输出目录 (与 create_spec_file 模板中的 onedir / upx=False 对应)
     cmd = [
         sys.executable,
         "-m", "PyInstaller",
         "--noconsole",
-        "--onefile",
-        f"--name=SSH批量运维工具",
+        "--onedir",
+        "--noupx",
+        # orjson 在 main_gui 中按需导入，静态分析可能漏掉，显式打包 (未安装时 PyInstaller 仅警告)
+        "--hidden-import=orjson",
+        f"--name={APP_NAME}",
         f"--icon={ICON_FILE}",
         f"--distpath={DIST_DIR}",
         f"--workpath={BUILD_DIR}",
@@ -167,21 +190,32 @@ def build_exe():
         return False
 
 def copy_config_files():
-    """复制配置文件到dist目录"""
-    print("复制配置文件到dist目录...")
+    """复制配置文件到程序目录"""
+    print("复制配置文件到程序目录...")
     
-    # 确保dist目录存在
-    if not DIST_DIR.exists():
-        print(f"⚠ 目标目录不存在，创建: {DIST_DIR}")
-        DIST_DIR.mkdir(parents=True, exist_ok=True)
+    # 确保程序目录存在
+    if not APP_DIR.exists():
+        print(f"⚠ 目标目录不存在，创建: {APP_DIR}")
+        APP_DIR.mkdir(parents=True, exist_ok=True)
     
-    for config_file in CONFIG_FILES:
-        if config_file.exists():
-            dest = DIST_DIR / config_file.name
-            shutil.copy2(config_file, dest)
-            print(f"✓ 复制文件: {config_file.name} -> {dest}")
-        else:
-            print(f"⚠ 配置文件不存在: {config_file}")
+    def copy_one(config_file):
+        if not config_file.exists():
+            return f"⚠ 配置文件不存在: {config_file}"
+        # copy2 在 Python 3.8+ 会自动使用系统级快速拷贝 (sendfile / CopyFileExW)
+        dest = APP_DIR / config_file.name
+        shutil.copy2(config_file, dest)
+        return f"✓ 复制文件: {config_file.name} -> {dest}"
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for msg in pool.map(copy_one, CONFIG_FILES):
+            print(msg)
+
+def make_zip():
+    """将程序目录打包为zip便于分发"""
+    print("打包程序目录为zip...")
+    archive = shutil.make_archive(str(DIST_DIR / APP_NAME), "zip", root_dir=DIST_DIR, base_dir=APP_NAME)
+    print(f"✓ 生成压缩包: {archive}")
+    return archive
 
 def main():
     """主函数"""
@@ -205,10 +239,14 @@ def main():
     # 4. 复制配置文件
     copy_config_files()
     
+    # 5. 生成zip
+    archive = make_zip()
+    
     print("\n" + "=" * 50)
     print("✅ 打包完成！")
-    print(f"可执行文件位置: {DIST_DIR}")
-    print(f"执行命令: {DIST_DIR}/SSH批量运维工具.exe")
+    print(f"可执行文件位置: {APP_DIR}")
+    print(f"执行命令: {APP_DIR}/{APP_NAME}.exe")
+    print(f"分发压缩包: {archive}")
     print("=" * 50)
     
     return 0
@@ -3,15 +3,53 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import yaml
 import paramiko
 import logging
+import logging.handlers
 import threading
 import queue
 import os
 import json
 import time
 import re
+import string
 import datetime
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import select
+import socket
+import codecs
+import shlex
+import uuid
+from collections import deque, defaultdict
+from itertools import chain
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+try:
+    import orjson  # 可选依赖：安装后主机列表序列化更快
+except ImportError:
+    orjson = None
+
+# 预编译的常用正则 (日志/Shell 读取热路径上复用)
+_ANSI_STRIP = re.compile(r'\x1b\[[0-9;]*[mK]')
+_ANSI_PARAM_CHARS = frozenset('0123456789;')
+_ANSI_FINAL_CHARS = frozenset(string.ascii_letters)
+_SU_FAIL = re.compile(r'(failure|认证失败|鉴定故障|incorrect)', re.IGNORECASE)
+_SU_RESULT = re.compile(r'(#|failure|认证失败|鉴定故障|incorrect)')
+_SHELL_PROMPT = re.compile(r'[\$>] ?$')
+_SUDO_RETRY = re.compile(r'(try again|incorrect password|请重试|密码错误)', re.IGNORECASE)
+_SUDO_OK = "__SUDO_OK__"
+_CMD_SEP = "__SEP__"
+SSH_KEEPALIVE = 30  # Transport 保活间隔(秒)，防止连接池中的空闲连接被中间设备断开
+_RECV_SIZE = 65536  # 单次 recv 大小，减少系统调用次数
+_SCAN_TAIL = 256  # _read_shell 跨 recv 边界保留的匹配窗口(字符)
+GUI_POLL_MS = 50         # GUI 队列轮询初始间隔(毫秒)
+GUI_POLL_MIN_MS = 20     # 消息密集时的最短轮询间隔
+GUI_POLL_MAX_MS = 500    # 长时间空闲时的最长轮询间隔
+GUI_BUSY_BATCH = 32      # 单轮消息数达到此值视为繁忙，缩短间隔
+GUI_IDLE_TICKS = 5       # 连续空轮次数达到此值后放宽间隔
+GUI_BATCH_MAX = 500      # 每轮最多处理的消息数，避免日志洪峰阻塞界面
+SAVE_DELAY_MS = 500      # 主机列表保存防抖延迟(毫秒)
+DEFAULT_SU_PROMPT_REGEX = r"(Password|密码|password|Passwort).*?[:：]"
+# 按配置字符串缓存编译结果，同一批次的所有 worker 共享
+compile_pattern = lru_cache(maxsize=32)(re.compile)
 
 # ============================
 # 0. 全局路径与配置
@@ -26,11 +64,16 @@ CONFIG_FILE = os.path.join(BASE_DIR, "config.yaml")
 HOSTS_DATA_FILE = os.path.join(BASE_DIR, "hosts_data.json")
 LOG_FILE_NAME = os.path.join(BASE_DIR, "ssh_debug.log")
 
+# 优先使用 libyaml 的 C 实现，未安装时退回纯 Python 解析器
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 DEFAULT_CONFIG_CONTENT = """# 全局配置文件
 settings:
   max_host_limit: 200     # 最大主机数
-  max_threads: 10         # 并发线程数
+  max_threads: auto       # 并发线程数 (auto 按 CPU 核数自动计算)
   timeout: 10             # SSH连接超时(秒)
+  pool_max_per_host: 1    # 每台主机缓存的空闲连接数 (0 为不复用)
+  use_sudo: false         # 非 root 用户先用登录密码 sudo -S 批量执行，失败再 su - (需账户有 sudo 权限)
 
 defaults:
   ssh_port: 22
@@ -54,22 +97,34 @@ commands:
   - "date"
 """
 
+class AnsiStripFormatter(logging.Formatter):
+    # 在日志监听线程中去除 ANSI 颜色码，工作线程无需做正则替换
+    def format(self, record):
+        text = super().format(record)
+        return _ANSI_STRIP.sub('', text) if '\x1b' in text else text
+
 def setup_global_logging():
     with open(LOG_FILE_NAME, 'w', encoding='utf-8') as f:
         f.write(f"=== Log Started at {datetime.datetime.now()} ===\n")
     logger = logging.getLogger("SSH_Tool_Core")
     logger.setLevel(logging.DEBUG)
     fh = logging.FileHandler(LOG_FILE_NAME, encoding='utf-8')
-    fh.setFormatter(logging.Formatter('%(asctime)s - [%(levelname)s] - %(message)s'))
-    logger.addHandler(fh)
+    fh.setFormatter(AnsiStripFormatter('%(asctime)s - [%(levelname)s] - %(message)s'))
+    # 工作线程只做入队，由后台监听线程统一写文件，避免争抢 FileHandler 锁
+    log_q = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_q))
+    listener = logging.handlers.QueueListener(log_q, fh, respect_handler_level=True)
+    listener.start()
     logging.getLogger("paramiko").setLevel(logging.WARNING)
-    return logger
+    return logger, listener
 
-sys_logger = setup_global_logging()
+sys_logger, log_listener = setup_global_logging()
 
 # ============================
 # 1. 核心 SSH 业务逻辑 (保持不变)
 # ============================
+_ALL_STATUS = "所有状态"  # 状态筛选框中表示不过滤
+
 class TaskStatus:
     WAITING = "等待中"
     RUNNING = "执行中"
@@ -81,7 +136,106 @@ class TaskStatus:
     
     @classmethod
     def all_statuses(cls):
-        return ["所有状态", cls.WAITING, cls.RUNNING, cls.SUCCESS, cls.FAIL_LOGIN, cls.FAIL_ROOT, cls.FAIL_CMD, cls.STOPPED]
+        return [_ALL_STATUS, cls.WAITING, cls.RUNNING, cls.SUCCESS, cls.FAIL_LOGIN, cls.FAIL_ROOT, cls.FAIL_CMD, cls.STOPPED]
+
+class SSHConnectionPool:
+    """按 (ip, port, user) 缓存已认证的 Transport，重复执行同一主机时跳过握手"""
+    def __init__(self, idle_timeout=300):
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._timer = None  # 有空闲连接时定期清理过期连接，池空后停止
+
+    def acquire(self, ip, port, user, passwords):
+        # 返回 (transport, 登录密码)，无可用连接时返回 (None, None)
+        # 登录密码已不在当前密码列表中 (密码被修改) 的连接不再复用，确保新密码会被实际验证
+        key = (ip, port, user)
+        while True:
+            with self._lock:
+                dq = self._idle.get(key)
+                if not dq: return None, None
+                transport, pwd, ts = dq.pop()
+            if pwd in passwords and time.time() - ts < self.idle_timeout and self._is_alive(transport): return transport, pwd
+            self._close(transport)
+            self.sweep()
+
+    def release(self, ip, port, user, transport, pwd, max_per_host=1):
+        if max_per_host > 0 and self._is_alive(transport):
+            with self._lock:
+                dq = self._idle.setdefault((ip, port, user), deque())
+                if len(dq) < max_per_host:
+                    dq.append((transport, pwd, time.time())); self._schedule_sweep(self.idle_timeout); return
+        self._close(transport)
+
+    def _schedule_sweep(self, delay):
+        # 调用方需持有 _lock
+        if self._timer is None:
+            self._timer = threading.Timer(max(delay, 1), self.sweep); self._timer.daemon = True; self._timer.start()
+
+    def sweep(self):
+        # 关闭所有超过 idle_timeout 的空闲连接 (每个队列左端最旧)
+        expired = []; now = time.time()
+        with self._lock:
+            if self._timer is not None: self._timer.cancel(); self._timer = None
+            for key, dq in list(self._idle.items()):
+                while dq and now - dq[0][2] >= self.idle_timeout: expired.append(dq.popleft()[0])
+                if not dq: del self._idle[key]
+            # 下次在最旧的剩余连接到期时清理
+            if self._idle: self._schedule_sweep(min(dq[0][2] for dq in self._idle.values()) + self.idle_timeout - now)
+        for transport in expired: self._close(transport)
+
+    def close_all(self):
+        with self._lock:
+            if self._timer is not None: self._timer.cancel(); self._timer = None
+            transports = [entry[0] for dq in self._idle.values() for entry in dq]
+            self._idle.clear()
+        for transport in transports: self._close(transport)
+
+    @staticmethod
+    def _is_alive(transport):
+        if not transport.is_active(): return False
+        try: transport.send_ignore(); return True
+        except: return False
+
+    @staticmethod
+    def _close(transport):
+        try: transport.close()
+        except: pass
+
+ssh_pool = SSHConnectionPool()
+
+_TS_CACHE = [0, ""]
+def ts_now():
+    # 时间戳精度为秒，同一秒内复用已格式化的字符串
+    t = int(time.time())
+    if t != _TS_CACHE[0]: _TS_CACHE[:] = [t, time.strftime("%H:%M:%S", time.localtime(t))]
+    return _TS_CACHE[1]
+
+def ensure_str_list(raw_data):
+    if raw_data is None: return []
+    if not isinstance(raw_data, (list, tuple)): raw_data = [raw_data]
+    return [str(item).strip() for item in raw_data if item is not None and str(item).strip()]
+
+def normalize_config(cfg):
+    # 默认密码列表只在加载配置时规范化一次，所有 worker 共享同一份 tuple
+    if not isinstance(cfg, dict): cfg = {}
+    defaults = cfg.get('defaults') or {}
+    cfg['defaults'] = defaults
+    defaults['_login_passwords_norm'] = tuple(ensure_str_list(defaults.get('login_passwords', [])))
+    defaults['_root_passwords_norm'] = tuple(ensure_str_list(defaults.get('root_passwords', [])))
+    return cfg
+
+def merge_unique(*lists):
+    # 保序去重，单次遍历，不构造中间拼接列表
+    seen = set()
+    return [x for x in chain(*lists) if not (x in seen or seen.add(x))]
+
+def resolve_max_threads(settings):
+    # auto: IO 密集型任务，按 CPU 核数放大，且不超过最大主机数
+    value = settings.get('max_threads', 'auto')
+    if str(value).strip().lower() == 'auto':
+        return min(int(settings.get('max_host_limit', 200)), 4 * (os.cpu_count() or 8))
+    return max(1, int(value))
 
 class SSHWorker:
     def __init__(self, host_info, config, log_callback, status_callback):
@@ -96,30 +250,29 @@ class SSHWorker:
         self.defaults = config.get('defaults', {})
         self.commands = config.get('commands', [])
         self.timeout = config.get('settings', {}).get('timeout', 10)
-        self.client = None; self.shell = None
+        self.pool_size = int(config.get('settings', {}).get('pool_max_per_host', 1))
+        self.port = int(self.defaults.get('ssh_port', 22))
+        self.use_sudo = bool(config.get('settings', {}).get('use_sudo', False))
+        self.transport = None; self.shell = None; self.login_user = None; self.login_pwd = None
+        # 留空时使用默认正则；正则无效时回退默认值并提示，不影响不需要 su 的主机
+        su_prompt = str(self.defaults.get('su_prompt_regex') or DEFAULT_SU_PROMPT_REGEX)
+        try: self._su_regex = compile_pattern(su_prompt)
+        except re.error as e:
+            self._su_regex = compile_pattern(DEFAULT_SU_PROMPT_REGEX)
+            self.log(f"⚠️ su_prompt_regex 无效 ({e})，使用默认正则")
 
     def log(self, msg):
-        ts = datetime.datetime.now().strftime("%H:%M:%S")
+        ts = ts_now()
         self.log_cb(self.ip, f"[{ts}] {msg}")
-        clean_msg = re.sub(r'\x1b\[[0-9;]*[mK]', '', msg)
-        sys_logger.info(f"[{self.ip}] {clean_msg}")
-
-    def ensure_str_list(self, raw_data):
-        if raw_data is None: return []
-        if not isinstance(raw_data, (list, tuple)): raw_data = [raw_data]
-        return [str(item).strip() for item in raw_data if item is not None and str(item).strip()]
+        sys_logger.info(f"[{self.ip}] {msg}")
 
     def run(self):
         self.status_cb(self.ip, TaskStatus.RUNNING)
         self.log(f"开始执行任务...")
         try:
             final_user = str(self.user).strip() if self.user else str(self.defaults.get('user', 'root')).strip()
-            default_pwds = self.ensure_str_list(self.defaults.get('login_passwords', []))
-            host_pwds = self.ensure_str_list(self.pwd)
-            login_pwds = list(dict.fromkeys(host_pwds + default_pwds))
-            default_root = self.ensure_str_list(self.defaults.get('root_passwords', []))
-            host_root = self.ensure_str_list(self.root_pwd)
-            root_pwds = list(dict.fromkeys(host_root + default_root))
+            login_pwds = merge_unique(ensure_str_list(self.pwd), self.defaults.get('_login_passwords_norm', ()))
+            root_pwds = merge_unique(ensure_str_list(self.root_pwd), self.defaults.get('_root_passwords_norm', ()))
 
             if not self._connect(final_user, login_pwds):
                 self.status_cb(self.ip, TaskStatus.FAIL_LOGIN)
@@ -132,6 +285,12 @@ class SSHWorker:
                 current_user = self._get_whoami()
                 self.log(f"登录成功，用户: {current_user}")
                 if "root" not in current_user.lower():
+                    # 开启 use_sudo 时先用登录密码 sudo -S 批量执行；sudo 不可用才回退到交互式 su -
+                    sudo_ok = self._run_with_sudo(self.login_pwd) if self.use_sudo else None
+                    if sudo_ok is not None:
+                        if sudo_ok: self.status_cb(self.ip, TaskStatus.SUCCESS); self.log("✅ 任务完成。")
+                        else: self.status_cb(self.ip, TaskStatus.FAIL_CMD); self.log("⚠️ sudo 执行中断。")
+                        return
                     if not self._switch_to_root(root_pwds):
                         self.status_cb(self.ip, TaskStatus.FAIL_ROOT)
                         self.log("❌ 错误：Root 提权失败")
@@ -147,70 +306,167 @@ class SSHWorker:
         except Exception as e:
             self.status_cb(self.ip, TaskStatus.FAIL_LOGIN); self.log(f"💥 异常: {str(e)}")
         finally:
-            if self.client:
-                try: self.client.close()
+            if self.shell:
+                try: self.shell.close()
                 except: pass
+            if self.transport: ssh_pool.release(self.ip, self.port, self.login_user, self.transport, self.login_pwd, self.pool_size)
 
     def _connect(self, user, passwords):
-        self.client = paramiko.SSHClient()
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.login_user = user
+        self.transport, self.login_pwd = ssh_pool.acquire(self.ip, self.port, user, passwords)
+        if self.transport:
+            self.log("复用已有连接")
+            return True
+        transport = None
         for i, pwd in enumerate(passwords):
-            try:
-                self.log(f"连接中... (密码 {i+1}/{len(passwords)})")
-                self.client.connect(hostname=self.ip, port=int(self.defaults.get('ssh_port', 22)), username=user, password=str(pwd), timeout=15, banner_timeout=60, auth_timeout=30, look_for_keys=False, allow_agent=False, gss_auth=False)
-                return True
-            except: continue
+            self.log(f"连接中... (密码 {i+1}/{len(passwords)})")
+            # 服务端中途断开时用新的 Transport 重试同一密码一次，避免跳过正确的密码
+            for _ in range(2):
+                # 多个密码复用同一个 Transport，只在服务端断开时才重新握手
+                if transport is None or not transport.is_active():
+                    try: transport = self._open_transport(self.port)
+                    except Exception as e:
+                        self.log(f"连接失败: {e}"); return False
+                try:
+                    transport.auth_password(user, str(pwd))
+                    self.transport = transport; self.login_pwd = str(pwd)
+                    return True
+                except paramiko.AuthenticationException: break
+                except Exception:
+                    transport.close(); transport = None
+        if transport: transport.close()
         return False
 
+    def _open_transport(self, port):
+        sock = socket.create_connection((self.ip, port), timeout=15)
+        transport = None
+        try:
+            transport = paramiko.Transport(sock)
+            transport.banner_timeout = 60; transport.auth_timeout = 30
+            transport.start_client(timeout=30)
+            transport.set_keepalive(SSH_KEEPALIVE)
+            return transport
+        except:
+            # 握手失败时关闭 Transport/socket，避免泄漏
+            if transport: transport.close()
+            else: sock.close()
+            raise
+
+    def _exec_command(self, cmd, timeout):
+        # 与 SSHClient.exec_command 相同：每条命令一个 session channel
+        chan = self.transport.open_session(timeout=timeout)
+        chan.settimeout(timeout)
+        chan.exec_command(cmd)
+        return chan.makefile_stdin('wb'), chan.makefile('r'), chan.makefile_stderr('r')
+
     def _get_whoami(self):
         try:
-            stdin, stdout, stderr = self.client.exec_command("whoami", timeout=10)
+            stdin, stdout, stderr = self._exec_command("whoami", timeout=10)
             return stdout.read().decode().strip()
         except: return "unknown"
 
-    def _read_shell(self, pattern, timeout=10):
-        buf = ""; end = time.time() + timeout
-        while time.time() < end:
-            if self.shell.recv_ready():
-                raw = self.shell.recv(4096).decode('utf-8', errors='ignore')
-                buf += raw
-                clean = re.sub(r'\x1b\[[0-9;]*[mK]', '', buf)
-                if re.search(pattern, clean): return buf
-            time.sleep(0.1)
-        return buf
+    def _read_shell(self, pattern, timeout=10, hint=None):
+        # pattern 为已编译正则，或按字面量查找的字符串
+        # hint 为可选的字面量候选，窗口中一个都不包含时直接跳过正则匹配
+        found = (lambda text: pattern in text) if isinstance(pattern, str) else pattern.search
+        # 增量解码：多字节 UTF-8 字符跨 recv 边界时不会被截断丢弃
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        chunks = []; tail = ""; end = time.time() + timeout
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0: break
+            # 阻塞等待数据到达，而不是固定间隔轮询
+            ready, _, _ = select.select([self.shell], [], [], remaining)
+            if not ready: break
+            data = self.shell.recv(_RECV_SIZE)
+            if not data: break  # 通道已关闭
+            raw = decoder.decode(data)
+            chunks.append(raw)
+            # 只扫描新数据 + 上次的尾部窗口，避免整块缓冲区反复匹配
+            window = tail + raw
+            if hint is None or any(h in window for h in hint):
+                clean = _ANSI_STRIP.sub('', window) if '\x1b' in window else window
+                if found(clean): break
+            tail = window[-_SCAN_TAIL:]
+        return "".join(chunks)
 
     def _switch_to_root(self, passwords):
-        regex = self.defaults.get('su_prompt_regex', r"(Password|密码|password|Passwort).*?[:：]")
+        regex = self._su_regex
         try:
-            self.shell = self.client.invoke_shell(width=300, height=100)
+            self.shell = self.transport.open_session()
+            self.shell.get_pty(term='vt100', width=300, height=100)
+            self.shell.invoke_shell()
             time.sleep(1)
-            self._read_shell(r"[\$>] ?$", timeout=5)
+            self._read_shell(_SHELL_PROMPT, timeout=5, hint=('$', '>'))
             self.shell.send("su -\n")
-            if not re.search(regex, self._read_shell(regex, timeout=10)): return False
+            if not regex.search(self._read_shell(regex, timeout=10)): return False
             for pwd in passwords:
                 self.shell.send(f"{str(pwd)}\n")
-                out = self._read_shell(r"(#|failure|认证失败|鉴定故障|incorrect)", timeout=5)
-                clean = re.sub(r'\x1b\[[0-9;]*[mK]', '', out)
-                if "#" in clean and not re.search(r"(failure|认证失败|鉴定故障|incorrect)", clean, re.IGNORECASE): return True
+                out = self._read_shell(_SU_RESULT, timeout=5)
+                clean = _ANSI_STRIP.sub('', out)
+                if "#" in clean and not _SU_FAIL.search(clean): return True
                 self.shell.send("su -\n"); self._read_shell(regex)
             return False
         except: return False
 
+    def _run_with_sudo(self, pwd):
+        # 返回 None 表示 sudo 不可用 (命令尚未执行，可回退 su)；True/False 为命令已执行后的结果
+        if not self.commands or not pwd: return None
+        # 所有命令按行拼成一个脚本，一次 exec_command 完成；以分隔符区分各命令输出
+        # 用换行而非 ";" 分隔，以 "&" 结尾或带 "#" 注释的命令不会影响后续命令
+        script = f"echo {_SUDO_OK}\nexec 2>&1\n" + f"\necho {_CMD_SEP}\n".join(self.commands) + "\n"
+        remote_cmd = f"sudo -S -p '' bash -c {shlex.quote(script)}"
+        try:
+            # sudo -S 读取的是登录用户自己的密码，只尝试一次，避免累计失败次数导致账户锁定
+            stdin, stdout, stderr = self._exec_command(remote_cmd, timeout=30)
+            stdin.write(f"{pwd}\n"); stdin.flush(); stdin.channel.shutdown_write()
+            first = stdout.readline()
+        except: return None
+        if first.strip() != _SUDO_OK:
+            try: err = stderr.read().decode('utf-8', errors='ignore')
+            except: err = ""
+            self.log("sudo 密码验证失败，回退 su -" if _SUDO_RETRY.search(err) else "sudo 不可用，回退 su -")
+            return None
+        # 已看到 _SUDO_OK 说明命令已开始执行，之后出错不能再回退 su，否则命令会重复执行
+        self.log(f"sudo 批量执行 {len(self.commands)} 条命令...")
+        try: out = stdout.read().decode('utf-8', errors='ignore')
+        except Exception as e:
+            self.log(f"💥 sudo 输出读取异常: {e}"); return False
+        outputs = out.split(_CMD_SEP)
+        for cmd, output in zip(self.commands, outputs):
+            self.log(f">>> CMD: {cmd}")
+            self.log(f"{output.strip()}\n")
+        return len(outputs) >= len(self.commands)
+
+    def _stream_exec(self, cmd, timeout=30):
+        # stderr 合并到 stdout，逐行读取并输出，内存占用与命令输出大小无关
+        chan = self.transport.open_session(timeout=timeout)
+        try:
+            chan.set_combine_stderr(True)
+            chan.settimeout(timeout)
+            chan.exec_command(cmd)
+            for line in chan.makefile('rb'):
+                self.log(line.decode('utf-8', errors='ignore').rstrip())
+        finally:
+            chan.close()
+
     def _execute_commands(self):
         all_ok = True
         for cmd in self.commands:
             self.log(f">>> CMD: {cmd}")
             try:
-                output = ""
                 if self.shell:
-                    marker = "CMD_END"
-                    self.shell.send(f"{cmd}; echo {marker}\n")
+                    # 每条命令使用唯一结束标记；回显的命令行里标记被引号拆开，不会提前匹配
+                    marker = "__CMD_END_" + uuid.uuid4().hex
+                    self.shell.send(f"{cmd}; echo '{marker[:6]}''{marker[6:]}'\n")
                     raw = self._read_shell(marker, timeout=30)
-                    output = raw.replace(f"{cmd}; echo {marker}", "").replace(marker, "").strip()
+                    # 跳过第一行 (命令回显)，截取到标记为止
+                    start_idx = raw.find('\n') + 1
+                    end_idx = raw.rfind(marker)
+                    if end_idx < start_idx: end_idx = len(raw)
+                    self.log(f"{raw[start_idx:end_idx].strip()}\n")
                 else:
-                    stdin, stdout, stderr = self.client.exec_command(cmd, timeout=30)
-                    output = stdout.read().decode() + stderr.read().decode()
-                self.log(f"{output.strip()}\n")
+                    self._stream_exec(cmd)
             except: all_ok = False
         return all_ok
 
@@ -221,42 +477,85 @@ class AnsiColorHandler:
     def __init__(self, text_widget):
         self.text_widget = text_widget
         self.color_map = {'30':'black','31':'red','32':'#008000','33':'#B8860B','34':'#0000FF','35':'#800080','36':'#008080','37':'gray','90':'gray','91':'#FF4500','92':'#32CD32','93':'#FFD700','94':'#1E90FF','95':'#FF1493','96':'#00CED1','97':'black','0':'black','00':'black'}
+        self.current_tags = []  # ANSI 样式状态跨多次插入保持
         self.configure_tags()
 
     def configure_tags(self):
         for code, color in self.color_map.items(): self.text_widget.tag_config(f"fg_{code}", foreground=color)
         self.text_widget.tag_config("bold", font=('Consolas', 10, 'bold'))
 
+    def reset_state(self):
+        self.current_tags = []
+
     def insert_ansi_text(self, content):
-        parts = re.split(r'(\x1b\[[0-9;]*[a-zA-Z])', content)
-        current_tags = []
-        for part in parts:
-            if not part: continue
-            if part.startswith('\x1b['):
-                if part.endswith('m'):
-                    codes = part[2:-1].split(';')
-                    for c in codes:
-                        if c in ['0','00']: current_tags = []
-                        elif c in ['1','01']: current_tags.append('bold')
-                        elif c in self.color_map:
-                            current_tags = [t for t in current_tags if not t.startswith('fg_')]
-                            current_tags.append(f"fg_{c}")
-                elif part.endswith('K'): pass
-            else: self.text_widget.insert('end', part, tuple(current_tags))
+        # 快速路径：不含 ESC 的纯文本直接插入，跳过正则拆分
+        if '\x1b' not in content:
+            self.text_widget.insert('end', content, tuple(self.current_tags))
+            return
+        # 单趟扫描：str.find 定位 ESC[ 序列，(文本, 样式) 成对收集后一次 insert 提交
+        current_tags = self.current_tags
+        args = []; i = 0; n = len(content)
+        while i < n:
+            j = content.find('\x1b[', i)
+            if j < 0:
+                args += (content[i:], tuple(current_tags)); break
+            if j > i: args += (content[i:j], tuple(current_tags))
+            k = j + 2
+            while k < n and content[k] in _ANSI_PARAM_CHARS: k += 1
+            if k < n and content[k] in _ANSI_FINAL_CHARS:
+                # 只处理 SGR (m)，其他控制序列 (如 K) 直接丢弃
+                if content[k] == 'm': current_tags = self.apply_sgr(current_tags, content[j+2:k])
+                i = k + 1
+            else:
+                # 不完整的序列按普通文本输出
+                args += (content[j:k], tuple(current_tags)); i = k
+        self.current_tags = current_tags
+        if args: self.text_widget.insert('end', *args)
+
+    def apply_sgr(self, current_tags, params):
+        for c in params.split(';'):
+            if c in ('0','00'): current_tags = []
+            elif c in ('1','01'): current_tags.append('bold')
+            elif c in self.color_map:
+                current_tags = [t for t in current_tags if not t.startswith('fg_')]
+                current_tags.append(f"fg_{c}")
+        return current_tags
 
 # ============================
 # 3. 界面逻辑 (功能增强)
 # ============================
+class BatchQueue:
+    """多生产者/单消费者消息队列：消费端一次加锁取走整批消息"""
+    def __init__(self):
+        self._items = deque()
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        with self._lock: self._items.append(item)
+
+    def drain(self, max_items):
+        with self._lock:
+            if len(self._items) <= max_items:
+                batch = list(self._items); self._items.clear()
+            else:
+                batch = [self._items.popleft() for _ in range(max_items)]
+        return batch
+
 class SmartParser:
+    # 分隔符统一替换为空格，再用 str.split() 切分 (自动合并连续空白)
+    _SEP_TRANS = str.maketrans({',': ' ', '，': ' ', ';': ' ', '\t': ' '})
+
     @staticmethod
     def parse_text(text):
         hosts = []
-        for line in text.split('\n'):
-            line = line.strip()
-            if not line or line.startswith("#"): continue
-            parts = re.split(r'[,\s，;\t]+', line)
-            parts = [p for p in parts if p]
-            if not parts or len(parts[0]) < 7: continue
+        # 整段文本只做一次分隔符替换，逐行仅需 split
+        for line in text.translate(SmartParser._SEP_TRANS).splitlines():
+            # 只有行首是空白时才需要去除 (影响注释判断)，行尾空白交给 split 处理
+            if line[:1].isspace(): line = line.lstrip()
+            # 不足 7 个字符不可能包含合法 IP，与注释行一起在切分前跳过
+            if len(line) < 7 or line[0] == "#": continue
+            parts = line.split()
+            if len(parts[0]) < 7: continue
             ip = parts[0]
             user = parts[1] if len(parts) > 1 else ""
             pwd = parts[2] if len(parts) > 2 else ""
@@ -272,19 +571,32 @@ class ModernGUI:
         self.root.geometry("1280x850")
         
         self.ensure_config()
+        self._config_cache = None  # (mtime_ns, config)
         self.config = self.load_config()
-        self.host_logs = {} 
+        self.host_logs = {}  # ip -> 日志分段列表，显示时再拼接
         self.data_store = {} 
         self.host_statuses = {} 
         self.is_running = False
         self.stop_flag = False
-        self.gui_queue = queue.Queue()
+        self._save_pending = False
+        self._poll_ms = GUI_POLL_MS; self._idle_ticks = 0
+        # 主机数据/状态每次变化时递增，配合筛选条件判断表格是否需要刷新
+        self._data_version = 0; self._last_filter = None
+        # 表格中已有行的 iid，与每次 insert/delete 同步，避免 tree.exists 的 Tcl 往返
+        self._tree_iids = set()
+        # 执行线程池跨任务复用，首次执行时创建，线程数配置变化后重建
+        self._pool = None; self._pool_size = 0
+        self.gui_queue = BatchQueue()
+        self._status_values = TaskStatus.all_statuses()
+        # GUI 消息按类型分发，LOG 最频繁，查表避免逐个比较字符串
+        self._msg_handlers = {"LOG": self._on_log, "STAT": self._on_stat, "PROG": self._on_prog, "DONE": self._on_done}
+        self._tick_logs = defaultdict(list); self._tick_prog = None; self._tick_done = False
         
         self.setup_styles()
         self.create_layout()
-        # 注意：不要在 init 里调用 create_context_menu，改为动态创建
+        self.create_context_menus()
         self.load_history()
-        self.root.after(100, self.process_gui_queue)
+        self.root.after(GUI_POLL_MS, self.process_gui_queue)
 
     def center_window(self, win, width, height):
         win.update_idletasks()
@@ -298,9 +610,14 @@ class ModernGUI:
     
     def load_config(self):
         try: 
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f: return yaml.safe_load(f)
+            # 文件未修改时直接复用上次解析结果
+            mtime = os.stat(CONFIG_FILE).st_mtime_ns
+            if self._config_cache and self._config_cache[0] == mtime: return self._config_cache[1]
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f: cfg = normalize_config(yaml.load(f, Loader=YAML_LOADER))
+            self._config_cache = (mtime, cfg)
+            return cfg
         except:
-            return {}
+            return normalize_config({})
 
     def setup_styles(self):
         style = ttk.Style()
@@ -336,8 +653,8 @@ class ModernGUI:
         ttk.Label(filter_frame, text="Hostname:").pack(side="left", padx=5)
         self.filter_host_var = tk.StringVar(); ttk.Entry(filter_frame, textvariable=self.filter_host_var, width=15).pack(side="left")
         ttk.Label(filter_frame, text="Status:").pack(side="left", padx=5)
-        self.filter_status_var = tk.StringVar(value="所有状态")
-        ttk.Combobox(filter_frame, textvariable=self.filter_status_var, values=TaskStatus.all_statuses(), state="readonly", width=12).pack(side="left")
+        self.filter_status_var = tk.StringVar(value=_ALL_STATUS)
+        ttk.Combobox(filter_frame, textvariable=self.filter_status_var, values=self._status_values, state="readonly", width=12).pack(side="left")
         
         ttk.Button(filter_frame, text="🔎 查询", command=self.apply_filter).pack(side="left", padx=10)
         ttk.Button(filter_frame, text="❌ 重置", command=self.reset_filter).pack(side="left", padx=5)
@@ -367,8 +684,12 @@ class ModernGUI:
         self.tree.pack(side="left", fill="both", expand=True); vsb.pack(side="right", fill="y")
         
         self.tree.bind("<<TreeviewSelect>>", self.on_select_host)
-        # 绑定右键 (在点击时动态生成菜单)
+        # 绑定右键 (菜单在启动时创建一次)
         self.tree.bind("<Button-3>", self.show_context_menu)
+        # 状态颜色只需配置一次，后续插入/更新只切换 tag；未配置颜色的状态统一用 default
+        for status, color in self.tag_colors.items(): self.tree.tag_configure(status, foreground=color)
+        self.tree.tag_configure("default", foreground="black")
+        self._row_tags = {status: (status,) for status in self.tag_colors}
 
         # 右侧日志
         right = ttk.LabelFrame(paned, text="详情日志 (支持 ANSI 颜色)", padding=5)
@@ -382,33 +703,67 @@ class ModernGUI:
         f_ip = self.filter_ip_var.get().strip()
         f_host = self.filter_host_var.get().strip()
         f_stat = self.filter_status_var.get()
-        self.tree.delete(*self.tree.get_children())
-        for ip, data in self.data_store.items():
-            current_status = self.host_statuses.get(ip, TaskStatus.WAITING)
-            if f_ip and f_ip not in ip: continue
-            if f_host and f_host not in data.get('hostname', ''): continue
-            if f_stat != "所有状态" and f_stat != current_status: continue
-            self.insert_tree_item(data, current_status)
+        check_stat = f_stat != _ALL_STATUS
+        # 筛选条件和数据都没有变化时，表格已是最新
+        filter_key = (f_ip, f_host, f_stat, self._data_version)
+        if filter_key == self._last_filter: return
+        self._last_filter = filter_key
+        if not (f_ip or f_host or check_stat):
+            wanted = list(self.data_store)
+        else:
+            wanted = []; get_status = self.host_statuses.get; waiting = TaskStatus.WAITING
+            for ip, data in self.data_store.items():
+                if f_ip and f_ip not in ip: continue
+                if f_host and f_host not in data.get('hostname', ''): continue
+                if check_stat and f_stat != get_status(ip, waiting): continue
+                wanted.append(ip)
+        # 与当前表格做差异比较：只删除不再匹配的行、插入新匹配的行
+        current = self.tree.get_children()
+        wanted_set = set(wanted); shown = set(current)
+        kept = [ip for ip in current if ip in wanted_set]
+        if kept != [ip for ip in wanted if ip in shown]:
+            # 已显示行的相对顺序变化 (如重新导入调整了顺序)，整体重建
+            self.tree.delete(*current); self._tree_iids.clear(); shown = set(); kept = []
+        elif len(kept) != len(current):
+            gone = [ip for ip in current if ip not in wanted_set]
+            self.tree.delete(*gone); self._tree_iids.difference_update(gone)
+        if len(kept) == len(wanted): return
+        for idx, ip in enumerate(wanted):
+            if ip not in shown: self.insert_tree_item(self.data_store[ip], self.host_statuses.get(ip, TaskStatus.WAITING), idx)
 
     def reset_filter(self):
-        self.filter_ip_var.set(""); self.filter_host_var.set(""); self.filter_status_var.set("所有状态")
+        self.filter_ip_var.set(""); self.filter_host_var.set(""); self.filter_status_var.set(_ALL_STATUS)
         self.apply_filter()
 
     # --- 列表操作 ---
     def insert_host_row(self, h):
-        ip = h['ip']
-        self.data_store[ip] = h
-        if ip not in self.host_statuses: self.host_statuses[ip] = TaskStatus.WAITING
-        if ip not in self.host_logs: self.host_logs[ip] = f"--- Ready ---\n"
+        self.add_hosts([h])
+
+    def add_hosts(self, hosts):
+        # 批量添加：先填充数据，最后只刷新一次表格；已显示的行原地更新
+        self._data_version += 1
+        shown = self._tree_iids
+        for h in hosts:
+            ip = h['ip']
+            self.data_store[ip] = h
+            if ip not in self.host_statuses: self.host_statuses[ip] = TaskStatus.WAITING
+            if ip not in self.host_logs: self.host_logs[ip] = ["--- Ready ---\n"]
+            if ip in shown:
+                status = self.host_statuses[ip]
+                self.tree.item(ip, values=self.row_values(h, status), tags=self.status_tags(status))
         self.apply_filter()
 
-    def insert_tree_item(self, data, status):
+    def row_values(self, data, status):
+        return (data['ip'], data.get('hostname',''), status, data['user'], "***" if data['pwd'] else "", "***" if data['root_pwd'] else "")
+
+    def status_tags(self, status):
+        return self._row_tags.get(status, ("default",))
+
+    def insert_tree_item(self, data, status, index="end"):
         ip = data['ip']
-        if self.tree.exists(ip): self.tree.delete(ip)
-        self.tree.insert("", "end", iid=ip, values=(ip, data.get('hostname',''), status, data['user'], "***" if data['pwd'] else "", "***" if data['root_pwd'] else ""))
-        self.tree.item(ip, tags=(status,))
-        color = self.tag_colors.get(status, "black")
-        self.tree.tag_configure(status, foreground=color)
+        if ip in self._tree_iids: self.tree.delete(ip)
+        else: self._tree_iids.add(ip)
+        self.tree.insert("", index, iid=ip, values=self.row_values(data, status), tags=self.status_tags(status))
 
     # --- 新增功能：批量复制 ---
     def copy_filtered_hosts(self):
@@ -436,6 +791,21 @@ class ModernGUI:
         messagebox.showinfo("成功", f"已复制 {len(visible_ips)} 条数据到剪贴板！\n(包含真实密码，请妥善使用)")
 
     # --- 升级版右键菜单 (支持多选) ---
+    def create_context_menus(self):
+        # 单选/多选两套菜单只创建一次，弹出时仅更新带数量的标签
+        self.menu_single = tk.Menu(self.root, tearoff=0)
+        self.menu_single.add_command(label="仅运行此主机", accelerator="▶️", command=self.run_selected_hosts)
+        self.menu_single.add_separator()
+        self.menu_single.add_command(label="编辑主机信息", accelerator="✏️", command=self.edit_selected_host)
+        self.menu_single.add_command(label="删除当前主机", accelerator="🗑️", command=self.delete_selected_hosts)
+
+        self.menu_multi = tk.Menu(self.root, tearoff=0)
+        self.menu_multi.add_command(label="批量运行", accelerator="▶️", command=self.run_selected_hosts)
+        self.menu_multi.add_separator()
+        # 禁用编辑 (多选不可编辑)
+        self.menu_multi.add_command(label="编辑 (多选不可用)", state="disabled")
+        self.menu_multi.add_command(label="批量删除", accelerator="🗑️", command=self.delete_selected_hosts)
+
     def show_context_menu(self, event):
         # 识别鼠标点击的行
         clicked_item = self.tree.identify_row(event.y)
@@ -449,22 +819,14 @@ class ModernGUI:
             self.tree.selection_set(clicked_item)
             current_selection = [clicked_item] # 更新为单选
         
-        # 动态创建菜单
-        menu = tk.Menu(self.root, tearoff=0)
-        
         if len(current_selection) > 1:
             # === 多选模式 ===
-            menu.add_command(label=f"批量运行 ({len(current_selection)} 台)", accelerator="▶️", command=self.run_selected_hosts)
-            menu.add_separator()
-            # 禁用编辑 (多选不可编辑)
-            menu.add_command(label="编辑 (多选不可用)", state="disabled")
-            menu.add_command(label=f"批量删除 ({len(current_selection)} 台)", accelerator="🗑️", command=self.delete_selected_hosts)
+            menu = self.menu_multi
+            menu.entryconfigure(0, label=f"批量运行 ({len(current_selection)} 台)")
+            menu.entryconfigure(3, label=f"批量删除 ({len(current_selection)} 台)")
         else:
             # === 单选模式 ===
-            menu.add_command(label="仅运行此主机", accelerator="▶️", command=self.run_selected_hosts)
-            menu.add_separator()
-            menu.add_command(label="编辑主机信息", accelerator="✏️", command=self.edit_selected_host)
-            menu.add_command(label="删除当前主机", accelerator="🗑️", command=self.delete_selected_hosts)
+            menu = self.menu_single
             
         menu.post(event.x_root, event.y_root)
 
@@ -480,10 +842,10 @@ class ModernGUI:
         msg = f"确定要删除选中的 {len(sel)} 台主机吗？"
         if messagebox.askyesno("批量删除", msg):
             for ip in sel:
-                if ip in self.data_store: del self.data_store[ip]
-                if ip in self.host_statuses: del self.host_statuses[ip]
-                if ip in self.host_logs: del self.host_logs[ip]
-                self.tree.delete(ip)
+                self.data_store.pop(ip, None); self.host_statuses.pop(ip, None); self.host_logs.pop(ip, None)
+            # 一次 Tcl 调用删除全部选中行，避免逐行删除触发多次重绘
+            self.tree.delete(*sel); self._tree_iids.difference_update(sel)
+            self._data_version += 1
             self.save_history()
 
     def run_all_hosts(self):
@@ -495,12 +857,20 @@ class ModernGUI:
         if not ips_list: return
         self.is_running = True; self.stop_flag = False
         self.btn_run.config(state="disabled"); self.btn_stop.config(state="normal")
+        # 进度只在整数百分比变化时推送，开始前先归零，避免显示上一轮的 100%
+        self.progress_var.set(0)
         
         for ip in ips_list:
             self.update_data_status(ip, TaskStatus.WAITING)
-            self.host_logs[ip] = f"--- Started at {datetime.datetime.now()} ---\n"
+            self.host_logs[ip] = [f"--- Started at {datetime.datetime.now()} ---\n"]
+        # 当前查看的主机重新执行时，清空日志面板并复位 ANSI 状态，避免上次未结束的颜色延续到新日志
+        sel = self.tree.selection()
+        if sel and sel[0] in ips_list: self.on_select_host(None)
         
-        threading.Thread(target=self.run_thread, args=(ips_list,), daemon=True).start()
+        self._poll_ms = GUI_POLL_MS; self._idle_ticks = 0  # 任务开始时恢复正常轮询
+        # 在界面线程取主机信息快照，执行期间删除/重新导入主机不影响已排队的任务
+        hosts = [self.data_store[ip] for ip in ips_list if ip in self.data_store]
+        threading.Thread(target=self.run_thread, args=(hosts,), daemon=True).start()
 
     # --- 编辑与导入 ---
     def show_smart_import_editor(self):
@@ -509,16 +879,14 @@ class ModernGUI:
         ttk.Label(win, text="每行一台：IP [User] [Pwd] [RootPwd] [Hostname]", foreground="blue").pack(pady=5)
         txt = scrolledtext.ScrolledText(win)
         txt.pack(fill="both", expand=True, padx=10)
-        curr = ""
-        for ip, d in self.data_store.items():
-            curr += f"{d['ip']} {d['user']} {d['pwd']} {d['root_pwd']} {d.get('hostname','')}\n"
-        txt.insert("1.0", curr if curr else "# 示例: 192.168.1.100 root 123456 root123 my-server\n")
+        # 先收集各行再一次 join，避免逐行 += 拼接大字符串
+        lines = [f"{d['ip']} {d['user']} {d['pwd']} {d['root_pwd']} {d.get('hostname','')}\n" for d in self.data_store.values()]
+        txt.insert("1.0", "".join(lines) if lines else "# 示例: 192.168.1.100 root 123456 root123 my-server\n")
 
         def do_update():
             new_hosts = SmartParser.parse_text(txt.get("1.0", "end"))
             self.data_store = {}; self.host_statuses = {}; self.host_logs = {}
-            self.tree.delete(*self.tree.get_children())
-            for h in new_hosts: self.insert_host_row(h)
+            self.add_hosts(new_hosts)
             self.save_history()
             messagebox.showinfo("成功", f"更新了 {len(new_hosts)} 台主机"); win.destroy()
         ttk.Button(win, text="💾 更新列表", command=do_update).pack(pady=10)
@@ -557,8 +925,9 @@ class ModernGUI:
         except: pass
     def clear_list(self):
         if messagebox.askyesno("确认", "清空?"):
-            self.tree.delete(*self.tree.get_children())
+            self.tree.delete(*self.tree.get_children()); self._tree_iids.clear()
             self.data_store = {}; self.host_statuses = {}; self.host_logs = {}; self.save_history()
+            self._data_version += 1
     
     def on_select_host(self, event):
         # 仅显示选中的第一个主机的日志
@@ -567,66 +936,157 @@ class ModernGUI:
         ip = sel[0]
         self.log_area.config(state="normal")
         self.log_area.delete("1.0", "end")
-        self.ansi_renderer.insert_ansi_text(self.host_logs.get(ip, ""))
+        self.ansi_renderer.reset_state()
+        self.ansi_renderer.insert_ansi_text("".join(self.host_logs.get(ip, [])))
         self.log_area.see("end"); self.log_area.config(state="disabled")
 
     def save_history(self):
-        with open(HOSTS_DATA_FILE, 'w') as f: json.dump(list(self.data_store.values()), f)
+        # 防抖：短时间内的多次修改合并为一次写入
+        if self._save_pending: return
+        self._save_pending = True
+        self.root.after(SAVE_DELAY_MS, self._flush_history_cb)
+    def _flush_history_cb(self):
+        if not self.flush_history(): messagebox.showerror("保存失败", f"主机列表写入失败，详见日志：\n{HOSTS_DATA_FILE}")
+    def flush_history(self):
+        # 返回是否写入成功 (无待保存内容也视为成功)
+        if not self._save_pending: return True
+        self._save_pending = False
+        # 先写临时文件再替换，避免写入中途退出导致文件损坏
+        tmp_file = HOSTS_DATA_FILE + ".tmp"
+        hosts = list(self.data_store.values())
+        try:
+            if orjson:
+                with open(tmp_file, 'wb') as f: f.write(orjson.dumps(hosts))
+            else:
+                # 与 orjson 输出一致的紧凑格式，是否安装 orjson 写出的文件相同
+                with open(tmp_file, 'w', encoding='utf-8') as f: json.dump(hosts, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, HOSTS_DATA_FILE)
+            return True
+        except OSError as e:
+            # 目录只读/磁盘已满/目标文件被占用等
+            sys_logger.error(f"保存主机列表失败: {e}")
+            try: os.remove(tmp_file)
+            except OSError: pass
+            return False
     def load_history(self):
         if os.path.exists(HOSTS_DATA_FILE):
             try:
-                with open(HOSTS_DATA_FILE, 'r') as f:
-                    for h in json.load(f): self.insert_host_row(h)
+                with open(HOSTS_DATA_FILE, 'r', encoding='utf-8') as f:
+                    self.add_hosts(json.load(f))
             except: pass
     def stop_tasks(self):
         if self.is_running: self.stop_flag = True
 
     # --- 线程与更新 ---
-    def run_thread(self, ips_list):
-        max_t = self.config.get('settings', {}).get('max_threads', 5)
-        done = 0
-        with ThreadPoolExecutor(max_workers=max_t) as pool:
-            futures = []
-            for ip in ips_list:
-                if self.stop_flag: break
-                worker = SSHWorker(self.data_store[ip], self.config, self.cb_log, self.cb_status)
-                futures.append(pool.submit(worker.run))
-            for f in as_completed(futures):
-                done += 1; self.gui_queue.put(("PROG", (done/len(ips_list))*100))
-        self.is_running = False; self.gui_queue.put(("DONE", None))
+    def get_pool(self, size):
+        # 线程按需创建，池大小只需跟随配置；配置变化时旧池处理完已提交任务后退出
+        if self._pool is None or self._pool_size != size:
+            if self._pool is not None: self._pool.shutdown(wait=False)
+            self._pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix='ssh'); self._pool_size = size
+        return self._pool
+
+    def close_pool(self):
+        if self._pool is not None: self._pool.shutdown(wait=False, cancel_futures=True); self._pool = None
+
+    def run_thread(self, hosts):
+        total = len(hosts)
+        try:
+            if total == 1:
+                # 单台主机直接在当前执行线程中运行，无需经过线程池
+                SSHWorker(hosts[0], self.config, self.cb_log, self.cb_status).run()
+                self.gui_queue.put(("PROG", 100))
+                return
+            max_t = resolve_max_threads(self.config.get('settings', {}))
+            pool = self.get_pool(max_t)
+            max_in_flight = min(max_t, total) * 2  # 限制已提交未完成的任务数，按需补充
+            done = 0; last_pct = 0
+            pending = {}; targets = iter(hosts)
+            while True:
+                while not self.stop_flag and len(pending) < max_in_flight:
+                    host = next(targets, None)
+                    if host is None: break
+                    worker = SSHWorker(host, self.config, self.cb_log, self.cb_status)
+                    pending[pool.submit(worker.run)] = host['ip']
+                if not pending: break
+                finished, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for f in finished:
+                    if f.cancelled(): self.cb_status(pending[f], TaskStatus.STOPPED)
+                    del pending[f]
+                done += len(finished)
+                # 停止时立即取消尚未开始的任务
+                if self.stop_flag:
+                    for f in pending: f.cancel()
+                # 只在整数百分比变化时更新进度条，最多 100 次
+                pct = done * 100 // total
+                if pct != last_pct: last_pct = pct; self.gui_queue.put(("PROG", pct))
+            if self.stop_flag:
+                for host in targets: self.cb_status(host['ip'], TaskStatus.STOPPED)
+        except Exception: sys_logger.exception("任务调度异常")
+        finally:
+            # 无论是否异常都要复位运行状态，否则界面会一直停留在"任务运行中"
+            self.is_running = False; self.gui_queue.put(("DONE", None))
 
     def cb_log(self, ip, m): self.gui_queue.put(("LOG", (ip, m)))
     def cb_status(self, ip, s): self.gui_queue.put(("STAT", (ip, s)))
 
+    def _on_log(self, d):
+        ip, m = d
+        self._tick_logs[ip].append(m + "\n")
+
+    def _on_stat(self, d): self.update_data_status(*d)
+
+    def _on_prog(self, d): self._tick_prog = d
+
+    def _on_done(self, d): self._tick_done = True
+
+    def _flush_logs(self):
+        # 日志按 IP 合并后每个主机只拼接/渲染一次
+        log_by_ip = self._tick_logs; self._tick_logs = defaultdict(list)
+        host_logs = self.host_logs
+        for ip, msgs in log_by_ip.items():
+            if ip in host_logs: host_logs[ip].extend(msgs)
+        # 如果当前选中了某个有新日志的IP，统一渲染一次
+        sel = self.tree.selection()
+        if sel and sel[0] in log_by_ip:
+            config = self.log_area.config
+            config(state="normal")
+            self.ansi_renderer.insert_ansi_text("".join(log_by_ip[sel[0]]))
+            self.log_area.see("end"); config(state="disabled")
+
     def process_gui_queue(self):
-        while not self.gui_queue.empty():
-            try:
-                t, d = self.gui_queue.get_nowait()
-                if t == "LOG":
-                    ip, m = d
-                    self.host_logs[ip] += m + "\n"
-                    # 如果当前选中了该IP，实时渲染
-                    sel = self.tree.selection()
-                    if sel and sel[0] == ip:
-                        self.log_area.config(state="normal")
-                        self.ansi_renderer.insert_ansi_text(m + "\n")
-                        self.log_area.see("end"); self.log_area.config(state="disabled")
-                elif t == "STAT": self.update_data_status(*d)
-                elif t == "PROG": self.progress_var.set(d)
-                elif t == "DONE": 
-                    self.btn_run.config(state="normal"); self.btn_stop.config(state="disabled")
-                    messagebox.showinfo("完成", "任务结束")
-            except: pass
-        self.root.after(100, self.process_gui_queue)
+        # 一次取完队列，按消息类型查表分发
+        batch = self.gui_queue.drain(GUI_BATCH_MAX)
+        handlers = self._msg_handlers
+        for t, d in batch:
+            try: handlers[t](d)
+            except Exception: sys_logger.exception(f"GUI 消息处理失败: {t}")
+        if self._tick_logs: self._flush_logs()
+        if self._tick_prog is not None:
+            self.progress_var.set(self._tick_prog); self._tick_prog = None
+        if self._tick_done:
+            self._tick_done = False
+            self.btn_run.config(state="normal"); self.btn_stop.config(state="disabled")
+            messagebox.showinfo("完成", "任务结束")
+        # 本轮达到上限说明还有积压，空闲时立即继续
+        if len(batch) >= GUI_BATCH_MAX: self.root.after_idle(self.process_gui_queue); return
+        # 自适应轮询：繁忙时缩短间隔降低延迟，空闲时放宽间隔减少唤醒
+        if len(batch) >= GUI_BUSY_BATCH:
+            self._poll_ms = max(GUI_POLL_MIN_MS, self._poll_ms // 2); self._idle_ticks = 0
+        elif not batch:
+            self._idle_ticks += 1
+            if self._idle_ticks >= GUI_IDLE_TICKS:
+                self._poll_ms = min(GUI_POLL_MAX_MS, self._poll_ms * 2); self._idle_ticks = 0
+        else: self._idle_ticks = 0
+        self.root.after(self._poll_ms, self.process_gui_queue)
 
     def update_data_status(self, ip, s):
+        # 主机已被删除 (执行期间删除) 或状态未变化时无需更新
+        if ip not in self.data_store or self.host_statuses.get(ip) == s: return
         self.host_statuses[ip] = s
-        if self.tree.exists(ip):
-            vals = list(self.tree.item(ip, "values"))
-            vals[2] = s
-            self.tree.item(ip, values=vals, tags=(s,))
-            color = self.tag_colors.get(s, "black")
-            self.tree.tag_configure(s, foreground=color)
+        self._data_version += 1
+        if ip in self._tree_iids:
+            self.tree.set(ip, "status", s)
+            self.tree.item(ip, tags=self.status_tags(s))
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -635,4 +1095,10 @@ if __name__ == "__main__":
         windll.shcore.SetProcessDpiAwareness(1)
     except: pass
     app = ModernGUI(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    # 退出清理：保存失败也要关闭连接并停止日志监听，确保日志落盘
+    try: app.flush_history()
+    finally:
+        app.close_pool()
+        ssh_pool.close_all()
+        log_listener.stop()
\ No newline at end of file